@@ -2,6 +2,11 @@
 Ikin-Expert: Engine de Inferência e Sistemas Especialistas baseada em Algoritmo Rete Otimizado.
 Implementa Alpha Network, Beta Network e Hash Joins (Indexação) para alta performance.
 
+Além de declare()/run(), KnowledgeEngine oferece declare_many() e bulk() para
+carga em lote, compile() para gerar o código da rede Alpha, run_parallel() para
+regras marcadas com Rule(..., parallel_safe=True) e cardinality_hint para
+ordenar os joins. Fatos de subclasses casam com as regras da classe base.
+
 Copyright (c) 2026 Kalluan Cley Fiuza.
 Licensed under MIT OR Apache-2.0.
 """
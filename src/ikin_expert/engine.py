@@ -1,5 +1,15 @@
+import heapq
 import inspect
-from typing import Any, Callable, Dict, List, Optional, Type, Set, Tuple, Union
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import keyword
+import operator
+import sys
+from functools import partial
+import warnings
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional, Type, Set, Tuple, Union
 from collections import defaultdict
 from pydantic import BaseModel
 
@@ -18,8 +28,20 @@ class Match:
     def __repr__(self):
         return f"<Match {self.name}>"
 
+    def __eq__(self, other):
+        return isinstance(other, Match) and other.name == self.name
+
+    def __hash__(self):
+        return hash((Match, self.name))
+
     def __getattr__(self, name):
-        return Match(name)
+        # Internado por nome: MATCH.p_id is MATCH.p_id
+        match = _match_cache.get(name)
+        if match is None:
+            match = _match_cache[name] = Match(name)
+        return match
+
+_match_cache: Dict[str, Match] = {}
 
 # Instância global
 MATCH = Match("root")
@@ -39,27 +61,25 @@ class Token:
     Representa um caminho parcial na rede.
     Carrega a lista de fatos que satisfazem as regras até aquele ponto.
     """
+    __slots__ = ('parent', 'fact', '_flat_list')
     
     def __init__(self, parent: Optional['Token'], fact: Optional[Fact]):
         self.parent = parent
         self.fact = fact
-        self._flat_list = None
+        # Lista achatada construída incrementalmente a partir da do pai (O(1) por acesso)
+        if parent is None:
+            self._flat_list: List[Fact] = [] if fact is None else [fact]
+        elif fact is None:
+            self._flat_list = parent._flat_list
+        else:
+            self._flat_list = parent._flat_list + [fact]
     
     def to_list(self) -> List[Fact]:
-        if self._flat_list is None:
-            facts = []
-            current = self
-            while current is not None:
-                if current.fact is not None:
-                    facts.append(current.fact)
-                current = current.parent
-            self._flat_list = list(reversed(facts))
         return self._flat_list
 
     def get_fact_by_index(self, index: int) -> Optional[Fact]:
-        facts = self.to_list()
-        if 0 <= index < len(facts):
-            return facts[index]
+        if 0 <= index < len(self._flat_list):
+            return self._flat_list[index]
         return None
 
 # =============================================================================
@@ -70,157 +90,583 @@ class Pattern:
     def __init__(self, model_class: Type[Fact], **constraints):
         self.model_class = model_class
         self.constraints = constraints
+        # (campo, operador, valor) já separados de "campo__op", feito uma vez.
+        # Os nomes saídos do split são internados: getattr e os índices por
+        # campo passam a comparar ponteiros em vez de conteúdo.
+        self.parsed: Tuple[Tuple[str, str, Any], ...] = tuple(
+            (sys.intern(k.split("__", 1)[0]), sys.intern(k.split("__", 1)[1]) if "__" in k else "eq", v)
+            for k, v in constraints.items()
+        )
+        # Operador desconhecido (ex: idade__foo__gt) falha já na definição da
+        # regra, em vez de gerar um padrão que nunca casa
+        for key, (_, op, _) in zip(constraints, self.parsed):
+            if op not in _OPS:
+                raise ValueError(
+                    f"Restrição inválida '{key}' em Pattern({model_class.__name__}, ...): "
+                    f"operador '{op}' desconhecido (use {', '.join(_OPS)})."
+                )
+        # Mesma variável em dois campos do padrão (ex: x=MATCH.v, y=MATCH.v):
+        # pares (campo, campo anterior) cujos valores devem ser iguais
+        first_field: Dict[str, str] = {}
+        same: List[Tuple[str, str]] = []
+        for field, _, value in self.parsed:
+            if isinstance(value, Match):
+                if value.name in first_field:
+                    same.append((field, first_field[value.name]))
+                else:
+                    first_field[value.name] = field
+        self.same_fields: Tuple[Tuple[str, str], ...] = tuple(same)
 
 # =============================================================================
 # 4. NÓS DA REDE (Alpha, Beta, HashJoin)
 # =============================================================================
 
 class ReteNode:
+    __slots__ = ('children', '_alpha_index', '_alpha_children', '_child_entries')
+
     def __init__(self):
         self.children: List['ReteNode'] = []
+        # Índice (campo, operador, valor) -> AlphaNode filho, para compartilhar nós em O(1)
+        self._alpha_index: Dict[Tuple[str, str, Hashable], 'AlphaNode'] = {}
+        # Filhos Alpha são percorridos iterativamente (ver _walk_alpha); os
+        # demais filhos são chamados pelo ponto de entrada resolvido em add_child
+        self._alpha_children: List['AlphaNode'] = []
+        self._child_entries: List[Callable[[Any, Any], None]] = []
 
     def add_child(self, node: 'ReteNode'):
         self.children.append(node)
+        if isinstance(node, AlphaNode):
+            self._alpha_children.append(node)
+        else:
+            self._child_entries.append(self._entry_for(node))
         return node
 
+    def _entry_for(self, node: 'ReteNode') -> Callable[[Any, Any], None]:
+        # Lado Alpha (TypeNode/AlphaNode): filhos Beta e terminais recebem
+        # fatos por receive(fact, engine); receive_token(token, engine) é o
+        # equivalente do lado Beta. Filhos Alpha não passam por aqui: são
+        # percorridos por _walk_alpha, e os TypeNodes são a entrada da rede
+        # (ver KnowledgeEngine._dispatch_for).
+        return node.receive
+
+    def _fan_out_many(self, facts: List[Fact], engine):
+        # Lote de fatos: filhos Alpha filtram o lote inteiro de uma vez,
+        # os demais recebem os fatos aceitos um a um.
+        for entry in self._child_entries:
+            for fact in facts:
+                entry(fact, engine)
+        for child in self._alpha_children:
+            child.activate_many(facts, engine)
+
 # --- ALPHA NETWORK ---
 
+# Operadores suportados na sintaxe campo__op
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": operator.eq,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "neq": operator.ne,
+}
+
+# Sentinela para campos ausentes no fato
+_MISSING = object()
+
+def _make_test(field: str, cmp: Callable[[Any, Any], bool], value: Any, is_match: bool) -> Callable[[Fact], bool]:
+    # Teste especializado uma vez por nó: campo, comparador e valor viram
+    # variáveis do closure, sem leituras de atributo do nó a cada fato.
+    if is_match:
+        # MATCH (variável): basta o campo existir
+        def test(fact: Fact) -> bool:
+            return getattr(fact, field, _MISSING) is not _MISSING
+    else:
+        def test(fact: Fact) -> bool:
+            fact_val = getattr(fact, field, _MISSING)
+            return fact_val is not _MISSING and cmp(fact_val, value)
+    return test
+
+def _make_same_test(field: str, other: str) -> Callable[[Fact], bool]:
+    # Nó "same": variável repetida no padrão, o campo deve igualar o outro
+    def test(fact: Fact) -> bool:
+        fact_val = getattr(fact, field, _MISSING)
+        return fact_val is not _MISSING and fact_val == getattr(fact, other, _MISSING)
+    return test
+
+def _walk_alpha(node: ReteNode, fact: Fact, engine):
+    """
+    Percorre a sub-rede Alpha abaixo de `node` (já aprovado) com uma pilha
+    explícita: um único frame por fato, qualquer que seja a profundidade.
+    """
+    stack = [node]
+    pop, push = stack.pop, stack.append
+    while stack:
+        node = pop()
+        for entry in node._child_entries:
+            entry(fact, engine)
+        for child in reversed(node._alpha_children):
+            if child._test(fact):
+                push(child)
+
+def _is_plain_name(name: str) -> bool:
+    return name.isidentifier() and not keyword.iskeyword(name)
+
+# Operadores Python equivalentes, para o código gerado
+_OP_SYMBOLS = {"eq": "==", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=", "neq": "!="}
+
+def _compile_predicate(pattern: Pattern) -> Callable[[Fact], bool]:
+    """
+    Gera uma única função com todos os testes Alpha do padrão, ex:
+        def predicate(fact): v0 = fact.idade; return v0 > c0 and v0 < c1
+    Campos declarados no modelo são lidos como atributo direto; os demais
+    com getattr e sentinela (campo ausente reprova, como no AlphaNode).
+    """
+    model_fields = getattr(pattern.model_class, "model_fields", None) or {}
+    lines, tests = [], []
+    namespace: Dict[str, Any] = {"MISSING": _MISSING}
+    variables: Dict[str, str] = {}
+    for field, op, value in pattern.parsed:
+        var = variables.get(field)
+        if var is None:
+            var = variables[field] = f"v{len(variables)}"
+            if field in model_fields and _is_plain_name(field):
+                lines.append(f"{var} = fact.{field}")
+            else:
+                lines.append(f"{var} = getattr(fact, {field!r}, MISSING)")
+                lines.append(f"if {var} is MISSING: return False")
+        if isinstance(value, Match):
+            continue
+        symbol = _OP_SYMBOLS[op]
+        const = f"c{len(namespace) - 1}"
+        namespace[const] = value
+        tests.append(f"{var} {symbol} {const}")
+    for field, other in pattern.same_fields:
+        tests.append(f"{variables[field]} == {variables[other]}")
+    lines.append(f"return {' and '.join(tests) if tests else 'True'}")
+    source = "def predicate(fact):\n" + "".join(f"    {line}\n" for line in lines)
+    exec(compile(source, f"<ikin-pattern {pattern.model_class.__name__}>", "exec"), namespace)
+    return namespace["predicate"]
+
 class AlphaNode(ReteNode):
+    __slots__ = ('field', 'op', 'value', '_cmp', '_is_match', '_test')
+
     def __init__(self, field: str, op: str, value: Any):
         super().__init__()
         self.field = field
         self.op = op
         self.value = value
-        self.items: Set[Fact] = set()
+        self._is_match = isinstance(value, Match)
+        if op == "same":
+            # Operador interno: value é o nome do outro campo (ver
+            # Pattern.same_fields), comparado por igualdade
+            self._cmp = operator.eq
+            self._test = _make_same_test(field, value)
+        else:
+            # Comparador resolvido uma única vez (sem cadeia de ifs por fato);
+            # Pattern já rejeitou operadores desconhecidos
+            self._cmp = _OPS[op]
+            self._test = _make_test(field, self._cmp, value, self._is_match)
 
     def test(self, fact: Fact) -> bool:
-        if not hasattr(fact, self.field): return False
-        fact_val = getattr(fact, self.field)
-        
-        # Se o valor for um MATCH (variável), AlphaNode aprova.
-        if isinstance(self.value, Match):
-            return True
-
-        if self.op == "eq": return fact_val == self.value
-        if self.op == "gt": return fact_val > self.value
-        if self.op == "gte": return fact_val >= self.value
-        if self.op == "lt": return fact_val < self.value
-        if self.op == "lte": return fact_val <= self.value
-        if self.op == "neq": return fact_val != self.value
-        return False
-
-    def activate(self, fact: Fact, engine):
-        if self.test(fact):
-            self.items.add(fact)
-            for child in self.children:
-                if isinstance(child, AlphaNode):
-                    child.activate(fact, engine)
-                elif isinstance(child, BetaNode):
-                    child.right_activate(fact, engine)
-                elif isinstance(child, RuleTerminalNode):
-                    child.activate_single(fact, engine)
+        return self._test(fact)
+
+    def activate_many(self, facts: List[Fact], engine):
+        if self.op == "same":
+            test = self._test
+            passed = [f for f in facts if test(f)]
+            if passed:
+                self._fan_out_many(passed, engine)
+            return
+        values = [getattr(fact, self.field, _MISSING) for fact in facts]
+        if self._is_match:
+            passed = [f for f, v in zip(facts, values) if v is not _MISSING]
+        else:
+            cmp, value = self._cmp, self.value
+            passed = [f for f, v in zip(facts, values) if v is not _MISSING and cmp(v, value)]
+        if passed:
+            self._fan_out_many(passed, engine)
 
 class TypeNode(ReteNode):
+    # walk: sub-rede Alpha desenrolada por KnowledgeEngine.compile() (ou None)
+    __slots__ = ('model_class', 'walk')
+
     def __init__(self, model_class: Type[Fact]):
         super().__init__()
         self.model_class = model_class
-    
-    def activate(self, fact: Fact, engine):
-        if isinstance(fact, self.model_class):
-            for child in self.children:
-                if isinstance(child, AlphaNode):
-                    child.activate(fact, engine)
-                elif isinstance(child, BetaNode):
-                    child.right_activate(fact, engine)
-                elif isinstance(child, RuleTerminalNode):
-                    child.activate_single(fact, engine)
+        self.walk: Optional[Callable[[Fact, Any], None]] = None
+
+# Limite seguro de aninhamento de blocos no código gerado (o tokenizer do
+# Python recusa indentação acima de 100 níveis)
+_MAX_WALK_DEPTH = 90
+
+def _compile_alpha_walk(root: TypeNode) -> Optional[Callable[[Fact, Any], None]]:
+    """
+    Desenrola a sub-rede Alpha abaixo de `root` numa única função com ifs
+    aninhados, na mesma ordem de _walk_alpha, ex:
+        def walk(fact, engine):
+            v0 = fact.idade
+            e0(fact, engine)
+            if v0 > c1:
+                e2(fact, engine)
+    Cada campo é lido uma só vez por fato. Retorna None se a rede for
+    profunda demais para virar código.
+    """
+    model_fields = getattr(root.model_class, "model_fields", None) or {}
+    namespace: Dict[str, Any] = {"MISSING": _MISSING}
+    reads: List[str] = []
+    body: List[str] = []
+    variables: Dict[str, str] = {}
+    may_miss: Set[str] = set()
+
+    def bind(prefix: str, obj: Any) -> str:
+        name = f"{prefix}{len(namespace)}"
+        namespace[name] = obj
+        return name
+
+    def in_model(field: str) -> bool:
+        return field in model_fields and _is_plain_name(field)
+
+    def read(field: str) -> str:
+        # Cada campo é lido uma vez, no topo da função
+        var = variables.get(field)
+        if var is None:
+            var = variables[field] = f"v{len(variables)}"
+            if in_model(field):
+                reads.append(f"    {var} = fact.{field}")
+            else:
+                reads.append(f"    {var} = getattr(fact, {field!r}, MISSING)")
+                may_miss.add(var)
+        return var
+
+    def emit(node: ReteNode, depth: int) -> bool:
+        # Recursão só em tempo de compilação, limitada por _MAX_WALK_DEPTH
+        if depth > _MAX_WALK_DEPTH:
+            return False
+        pad = "    " * depth
+        for entry in node._child_entries:
+            body.append(f"{pad}{bind('e', entry)}(fact, engine)")
+        for child in node._alpha_children:
+            field = child.field
+            if child._is_match and in_model(field):
+                # MATCH sobre campo do modelo sempre aprova: sem if
+                if not emit(child, depth):
+                    return False
+                continue
+            if child.op == "same":
+                var, other = read(field), read(child.value)
+                tests = [f"{v} is not MISSING" for v in (var, other) if v in may_miss]
+                tests.append(f"{var} == {other}")
+            else:
+                symbol = None if child._is_match else _OP_SYMBOLS[child.op]
+                var = read(field)
+                tests = [f"{var} is not MISSING"] if var in may_miss else []
+                if symbol is not None:
+                    tests.append(f"{var} {symbol} {bind('c', child.value)}")
+            body.append(f"{pad}if {' and '.join(tests)}:")
+            mark = len(body)
+            if not emit(child, depth + 1):
+                return False
+            if len(body) == mark:
+                body.append(f"{pad}    pass")
+        return True
+
+    if not emit(root, 1):
+        return None
+    source = "def walk(fact, engine):\n" + "\n".join(reads + body or ["    pass"]) + "\n"
+    exec(compile(source, f"<ikin-alpha {root.model_class.__name__}>", "exec"), namespace)
+    return namespace["walk"]
 
 # --- BETA NETWORK ---
 
+# Laços internos dos joins: cruzam um lado com o balde do outro lado e
+# repassam cada par aos filhos num Token novo. Se o único
+# filho é um terminal, a ativação vai direto para a agenda, sem criar Token.
+def _probe_left(token: Token, facts: Iterable[Fact], node: 'BetaNode', engine):
+    terminal = node._sole_terminal
+    if terminal is not None:
+        base = token._flat_list
+        for fact in facts:
+            terminal.activate_facts(base + [fact], engine)
+    else:
+        child_entries = node._child_entries
+        for fact in facts:
+            new_token = Token(token, fact)
+            for entry in child_entries:
+                entry(new_token, engine)
+
+def _probe_right(fact: Fact, tokens: Iterable[Token], node: 'BetaNode', engine):
+    terminal = node._sole_terminal
+    if terminal is not None:
+        for token in tokens:
+            terminal.activate_facts(token._flat_list + [fact], engine)
+    else:
+        child_entries = node._child_entries
+        for token in tokens:
+            new_token = Token(token, fact)
+            for entry in child_entries:
+                entry(new_token, engine)
+
 class BetaNode(ReteNode):
+    __slots__ = ('_sole_terminal',)
+
     def __init__(self):
         super().__init__()
-        self.left_memory: List[Token] = []
-        self.right_memory: List[Fact] = []
+        self._sole_terminal: Optional[RuleTerminalNode] = None
+
+    def add_child(self, node: ReteNode):
+        super().add_child(node)
+        only = self.children[0] if len(self.children) == 1 else None
+        self._sole_terminal = only if isinstance(only, RuleTerminalNode) else None
+        return node
 
     def left_activate(self, token: Token, engine):
         raise NotImplementedError
 
     def right_activate(self, fact: Fact, engine):
         raise NotImplementedError
-    
-    def propagate(self, parent_token: Token, new_fact: Fact, engine):
-        new_token = Token(parent=parent_token, fact=new_fact)
-        for child in self.children:
-            if isinstance(child, BetaNode):
-                child.left_activate(new_token, engine)
-            elif isinstance(child, RuleTerminalNode):
-                child.activate_token(new_token, engine)
+
+    # Subclasses que definem left/right_activate na classe podem apontar
+    # receive/receive_token direto para eles e evitar esta chamada extra
+    def receive(self, fact: Fact, engine):
+        self.right_activate(fact, engine)
+
+    def receive_token(self, token: Token, engine):
+        self.left_activate(token, engine)
+
+    def _entry_for(self, node: ReteNode) -> Callable[[Any, Any], None]:
+        # Lado Beta: os filhos recebem tokens
+        return node.receive_token
 
 class CartesianBetaNode(BetaNode):
+    # Só o produto cartesiano guarda memórias planas; os hash joins guardam
+    # cada lado indexado pela chave do join (left_index/right_index).
+    __slots__ = ('left_memory', 'right_memory')
+
+    def __init__(self):
+        super().__init__()
+        self.left_memory: List[Token] = []
+        self.right_memory: List[Fact] = []
+
     def left_activate(self, token: Token, engine):
         self.left_memory.append(token)
-        for fact in self.right_memory:
-            self.propagate(token, fact, engine)
+        _probe_left(token, self.right_memory, self, engine)
 
     def right_activate(self, fact: Fact, engine):
         self.right_memory.append(fact)
-        for token in self.left_memory:
-            self.propagate(token, fact, engine)
+        _probe_right(fact, self.left_memory, self, engine)
+
+    receive = right_activate
+    receive_token = left_activate
+
+# Código especializado por HashJoinNode: campos e índice ficam fixos no
+# bytecode, sem getattr dinâmico nem chamada extra por par casado.
+_JOIN_TEMPLATE = """
+def left_activate(token, engine):
+    facts = token._flat_list
+    key = {left_key}
+    bucket = left_index.get(key, MISSING)
+    if bucket is MISSING:
+        left_index[key] = token
+    elif type(bucket) is list:
+        bucket.append(token)
+    else:
+        left_index[key] = [bucket, token]
+    bucket = right_index.get(key, MISSING)
+    if bucket is not MISSING:
+        if type(bucket) is not list:
+            bucket = (bucket,)
+        terminal = node._sole_terminal
+        if terminal is not None:
+            for fact in bucket:
+                terminal.activate_facts(facts + [fact], engine)
+        else:
+            for fact in bucket:
+                new_token = Token(token, fact)
+                for entry in child_entries:
+                    entry(new_token, engine)
+
+def right_activate(fact, engine):
+    key = {right_key}
+    bucket = right_index.get(key, MISSING)
+    if bucket is MISSING:
+        right_index[key] = fact
+    elif type(bucket) is list:
+        bucket.append(fact)
+    else:
+        right_index[key] = [bucket, fact]
+    bucket = left_index.get(key, MISSING)
+    if bucket is not MISSING:
+        if type(bucket) is not list:
+            bucket = (bucket,)
+        terminal = node._sole_terminal
+        if terminal is not None:
+            for token in bucket:
+                terminal.activate_facts(token._flat_list + [fact], engine)
+        else:
+            for token in bucket:
+                new_token = Token(token, fact)
+                for entry in child_entries:
+                    entry(new_token, engine)
+"""
+
+def _bucket_add(index: Dict[Any, Any], key: Any, item: Any):
+    bucket = index.get(key, _MISSING)
+    if bucket is _MISSING:
+        index[key] = item
+    elif type(bucket) is list:
+        bucket.append(item)
+    else:
+        index[key] = [bucket, item]
+
+def _bucket_iter(index: Dict[Any, Any], key: Any) -> Iterable[Any]:
+    bucket = index.get(key, _MISSING)
+    if bucket is _MISSING:
+        return ()
+    if type(bucket) is list:
+        return bucket
+    return (bucket,)
+
+def _compile_join(node: 'HashJoinNode') -> Optional[Tuple[Callable, Callable]]:
+    """
+    Gera left_activate/right_activate especializados para o nó.
+    Retorna None se os campos não puderem ser usados como atributo literal.
+    """
+    configs = node.join_configs
+    if not all(_is_plain_name(lf) and _is_plain_name(rf) for _, lf, rf in configs):
+        return None
+    left_keys = [f"facts[{int(li)}].{lf}" for li, lf, _ in configs]
+    right_keys = [f"fact.{rf}" for _, _, rf in configs]
+    if len(configs) == 1:
+        left_key, right_key = left_keys[0], right_keys[0]
+    else:
+        left_key, right_key = f"({', '.join(left_keys)})", f"({', '.join(right_keys)})"
+    source = _JOIN_TEMPLATE.format(left_key=left_key, right_key=right_key)
+    namespace = {
+        "Token": Token,
+        "MISSING": _MISSING,
+        "node": node,
+        "left_index": node.left_index,
+        "right_index": node.right_index,
+        "child_entries": node._child_entries,
+    }
+    label = ",".join(f"{lf}={rf}" for _, lf, rf in configs)
+    exec(compile(source, f"<ikin-join {label}>", "exec"), namespace)
+    return namespace["left_activate"], namespace["right_activate"]
 
 class HashJoinNode(BetaNode):
+    # left_activate/right_activate (e seus apelidos receive_token/receive) são
+    # slots: recebem o código gerado ou, na falta dele, os métodos genéricos
+    # _left_activate/_right_activate.
+    __slots__ = ('join_configs', 'left_index', 'right_index',
+                 'left_activate', 'right_activate', 'receive', 'receive_token')
+
     def __init__(self, left_idx: int, left_field: str, right_field: str):
         super().__init__()
-        self.left_idx = left_idx
-        self.left_field = left_field
-        self.right_field = right_field
-        self.left_index: Dict[Any, List[Token]] = defaultdict(list)
-        self.right_index: Dict[Any, List[Fact]] = defaultdict(list)
+        self._init_join([(left_idx, left_field, right_field)])
+
+    def _init_join(self, join_configs: List[Tuple[int, str, str]]):
+        # Estado comum a HashJoinNode e MultiKeyHashJoinNode:
+        # (índice do fato no token, campo à esquerda, campo à direita)
+        self.join_configs: List[Tuple[int, str, str]] = list(join_configs)
+        # Baldes com um só item guardam o próprio item; viram lista na colisão
+        self.left_index: Dict[Any, Union[Token, List[Token]]] = {}
+        self.right_index: Dict[Any, Union[Fact, List[Fact]]] = {}
+        self._specialize()
+
+    def _specialize(self):
+        # Usa a versão gerada quando possível, senão os métodos genéricos.
+        # Precisa acontecer antes de add_child capturar os pontos de entrada.
+        compiled = _compile_join(self)
+        if compiled is None:
+            compiled = (self._left_activate, self._right_activate)
+        self.left_activate, self.right_activate = compiled
+        self.receive_token, self.receive = compiled
 
     def _get_key(self, obj: Any, field: str) -> Any:
         return getattr(obj, field, None)
 
-    def left_activate(self, token: Token, engine):
-        target_fact = token.get_fact_by_index(self.left_idx)
-        if not target_fact: return
-        key = self._get_key(target_fact, self.left_field)
-        self.left_index[key].append(token)
-        if key in self.right_index:
-            for fact in self.right_index[key]:
-                self.propagate(token, fact, engine)
+    def _left_key(self, token: Token) -> Any:
+        # left_idx é sempre válido: o token chega com um fato por padrão anterior
+        left_idx, left_field, _ = self.join_configs[0]
+        return self._get_key(token._flat_list[left_idx], left_field)
 
-    def right_activate(self, fact: Fact, engine):
-        key = self._get_key(fact, self.right_field)
-        self.right_index[key].append(fact)
-        if key in self.left_index:
-            for token in self.left_index[key]:
-                self.propagate(token, fact, engine)
+    def _right_key(self, fact: Fact) -> Any:
+        return self._get_key(fact, self.join_configs[0][2])
+
+    def _left_activate(self, token: Token, engine):
+        key = self._left_key(token)
+        _bucket_add(self.left_index, key, token)
+        _probe_left(token, _bucket_iter(self.right_index, key), self, engine)
+
+    def _right_activate(self, fact: Fact, engine):
+        key = self._right_key(fact)
+        _bucket_add(self.right_index, key, fact)
+        _probe_right(fact, _bucket_iter(self.left_index, key), self, engine)
+
+class MultiKeyHashJoinNode(HashJoinNode):
+    """
+    Hash join sobre a tupla de todas as variáveis que o padrão compartilha
+    com padrões anteriores (ex: mesmo paciente E mesma data).
+    """
+    __slots__ = ()
+
+    def __init__(self, join_configs: List[Tuple[int, str, str]]):
+        BetaNode.__init__(self)
+        self._init_join(join_configs)
+
+    def _left_key(self, token: Token) -> Any:
+        facts = token._flat_list
+        return tuple(self._get_key(facts[li], lf) for li, lf, _ in self.join_configs)
+
+    def _right_key(self, fact: Fact) -> Any:
+        return tuple(self._get_key(fact, rf) for _, _, rf in self.join_configs)
 
 class DummyBetaNode(ReteNode):
-    def left_activate(self, engine):
-        for child in self.children:
-            if isinstance(child, BetaNode):
-                child.left_activate(Token(None, None), engine)
+    __slots__ = ()
+
+    def _entry_for(self, node: ReteNode) -> Callable[[Any, Any], None]:
+        return node.receive_token
 
 class RuleTerminalNode(ReteNode):
+    __slots__ = ('rule_name', 'action', 'salience', 'arity', 'order', 'fast_predicate',
+                 'parallel_safe')
+
     def __init__(self, rule_name: str, action: Callable, salience: int):
         super().__init__()
         self.rule_name = rule_name
         self.action = action
         self.salience = salience
+        # Aridade da ação, calculada uma vez (inspect.signature é caro)
+        self.arity = len(inspect.signature(action).parameters)
+        # Se os padrões foram reordenados na compilação: posição no token de
+        # cada padrão, na ordem em que a regra os declarou.
+        self.order: Optional[List[int]] = None
+        # Regras de um só padrão: todos os testes Alpha numa função gerada
+        self.fast_predicate: Optional[Callable[[Fact], bool]] = None
+        # Pode disparar em paralelo com outras regras (ver run_parallel)
+        self.parallel_safe: bool = getattr(action, "_parallel_safe", False)
 
     def activate_token(self, token: Token, engine):
-        facts = token.to_list()
+        self.activate_facts(token.to_list(), engine)
+
+    def activate_facts(self, facts: List[Fact], engine):
+        if self.order is not None:
+            facts = [facts[i] for i in self.order]
         engine.agenda.add_activation(self, facts)
 
     def activate_single(self, fact: Fact, engine):
         engine.agenda.add_activation(self, [fact])
 
+    receive = activate_single
+    receive_token = activate_token
+
 # =============================================================================
 # 5. ENGINE E AGENDA
 # =============================================================================
 
 class Activation:
+    __slots__ = ('node', 'facts', 'priority')
+
     def __init__(self, node: RuleTerminalNode, facts: List[Fact]):
         self.node = node
         self.facts = facts
@@ -228,32 +674,132 @@ class Activation:
 
 class Agenda:
     def __init__(self):
-        self.activations: List[Activation] = []
+        # Heap de (-saliência, sequência, ativação): a sequência garante FIFO
+        # entre ativações de mesma saliência e evita comparar Activation.
+        self.activations: List[Tuple[int, int, Activation]] = []
+        self._seq = itertools.count()
+        # Profundidade de carga em lote: enquanto > 0 só acumula, e o heap é
+        # montado uma vez quando o bloco mais externo termina
+        self._bulk = 0
+        # Itens anexados fora de ordem desde o último heapify
+        self._dirty = False
 
     def add_activation(self, node: RuleTerminalNode, facts: List[Fact]):
-        self.activations.append(Activation(node, facts))
-        self.activations.sort(key=lambda x: x.priority, reverse=True)
+        item = (-node.salience, next(self._seq), Activation(node, facts))
+        if self._bulk:
+            self.activations.append(item)
+            self._dirty = True
+        else:
+            heapq.heappush(self.activations, item)
+
+    def begin_bulk(self):
+        self._bulk += 1
+
+    def end_bulk(self):
+        self._bulk -= 1
+        if self._bulk == 0:
+            self._restore_heap()
+
+    def _restore_heap(self):
+        # Só refaz o heap se algo foi anexado sem heappush: dentro de um bloco
+        # bulk, pops seguidos sem novas ativações continuam O(log n)
+        if self._dirty:
+            heapq.heapify(self.activations)
+            self._dirty = False
 
     def pop(self) -> Optional[Activation]:
         if not self.activations: return None
-        return self.activations.pop(0)
+        self._restore_heap()
+        return heapq.heappop(self.activations)[2]
+
+    def peek(self) -> Optional[Activation]:
+        if not self.activations: return None
+        self._restore_heap()
+        return self.activations[0][2]
 
     def clear(self):
         self.activations.clear()
+        self._dirty = False
 
-def Rule(*patterns: Pattern, salience: int = 0):
+def Rule(*patterns: Pattern, salience: int = 0, parallel_safe: bool = False):
+    # parallel_safe: a ação não depende de outras ativações da mesma rodada
+    # e pode rodar numa thread à parte em run_parallel()
     def decorator(func):
         func._is_rule = True
         func._patterns = patterns
         func._salience = salience
+        func._parallel_safe = parallel_safe
         return func
     return decorator
 
+def _is_unsatisfiable(pattern: Pattern) -> bool:
+    """
+    Detecta padrões que nenhum fato satisfaz: um campo com igualdade constante
+    cujo valor viola outra restrição constante do mesmo campo
+    (ex: idade=30, idade__gt=40).
+    """
+    by_field: Dict[str, List[Tuple[str, Any]]] = defaultdict(list)
+    for field, op, value in pattern.parsed:
+        if isinstance(value, Match):
+            continue
+        by_field[field].append((op, value))
+    for constraints in by_field.values():
+        for op, value in constraints:
+            if op != "eq":
+                continue
+            for other_op, other_value in constraints:
+                try:
+                    if not _OPS[other_op](value, other_value):
+                        return True
+                except TypeError:
+                    # Tipos incomparáveis: nada a concluir estaticamente
+                    pass
+    return False
+
+def _canonical_pattern(pattern: Pattern, var_slots: Dict[str, int]) -> Tuple:
+    """
+    Forma canônica de um padrão para compartilhar prefixos Beta: restrições
+    ordenadas e variáveis MATCH trocadas pela ordem em que aparecem na regra.
+    """
+    items = []
+    for key in sorted(pattern.constraints):
+        value = pattern.constraints[key]
+        if isinstance(value, Match):
+            value = (Match, var_slots.setdefault(value.name, len(var_slots)))
+        items.append((key, value))
+    return (pattern.model_class, tuple(items))
+
+# Por classe de fato: (atalhos de igualdade, pares (predicado, ativação) das
+# regras rápidas, TypeNodes e a função que percorre a sub-rede Alpha de cada um)
+_Dispatch = Tuple[Tuple[Dict[Tuple[str, ...], Dict[Tuple, List[RuleTerminalNode]]], ...],
+                  Tuple[Tuple[Callable[[Fact], bool], Callable[[Fact, Any], None]], ...],
+                  Tuple[TypeNode, ...],
+                  Tuple[Callable[[Fact, Any], None], ...]]
+
 class KnowledgeEngine:
+    # Estimativa opcional de quantos fatos de cada tipo existirão; usada para
+    # ordenar os joins. Ex: cardinality_hint = {Exame: 10_000, Paciente: 100}
+    # O padrão é imutável: cada subclasse define o seu próprio dicionário, sem
+    # alterar a ordem dos joins das demais engines.
+    cardinality_hint: Mapping[Type[Fact], int] = MappingProxyType({})
+
     def __init__(self):
         self.agenda = Agenda()
         self.rete_root: Dict[Type[Fact], TypeNode] = {}
         self.dummy_beta = DummyBetaNode()
+        self._beta_prefix_cache: Dict[Tuple, BetaNode] = {}
+        # Atalho para regras de um só padrão com apenas igualdades:
+        # tipo -> campos -> valores -> terminais (sem passar pela rede Alpha)
+        self._eq_shortcut: Dict[Type[Fact], Dict[Tuple[str, ...], Dict[Tuple, List[RuleTerminalNode]]]] = {}
+        # Demais regras de um só padrão: tipo -> terminais com fast_predicate
+        self._fast_rules: Dict[Type[Fact], List[RuleTerminalNode]] = {}
+        # Classe concreta do fato -> o que visitar, já resolvido pela MRO
+        self._type_dispatch: Dict[type, _Dispatch] = {}
+        # Se compile() foi chamado, reset() recompila a rede nova
+        self._compiled = False
+        # Durante um lote de run_parallel: fatos declarados pelas regras
+        # ficam aqui até o lote terminar
+        self._deferred: Optional[List[Fact]] = None
         self._build_network()
 
     # --- NOVO MÉTODO (CORREÇÃO DE BUG) ---
@@ -264,111 +810,400 @@ class KnowledgeEngine:
         self.agenda.clear()
         self.rete_root = {}
         self.dummy_beta = DummyBetaNode()
+        self._beta_prefix_cache = {}
+        self._eq_shortcut = {}
+        self._fast_rules = {}
+        self._type_dispatch = {}
         self._build_network()
+        if self._compiled:
+            self.compile()
 
     def _build_network(self):
-        for name, method in inspect.getmembers(self):
-            if getattr(method, "_is_rule", False):
-                self._compile_rule(method)
+        for name in self._rule_names():
+            self._compile_rule(getattr(self, name))
 
-    def _get_or_create_alpha_chain(self, pattern: Pattern) -> ReteNode:
+    @classmethod
+    def _rule_names(cls) -> Tuple[str, ...]:
+        # Varre a classe uma única vez (e não a cada instância/reset); o cache
+        # fica no __dict__ da própria classe para não vazar para subclasses
+        names = cls.__dict__.get('_rules_cache')
+        if names is None:
+            names = tuple(name for name, member in inspect.getmembers(cls)
+                          if getattr(member, "_is_rule", False))
+            cls._rules_cache = names
+        return names
+
+    def _check_pattern(self, pattern: Pattern):
         # --- BLINDAGEM CONTRA ERROS DE TIPO ---
         if not isinstance(pattern, Pattern):
             raise TypeError(f"Erro na Regra: Esperado objeto 'Pattern', recebido {type(pattern)}. Use Pattern(Classe, ...)")
+
+    def _get_or_create_alpha_chain(self, pattern: Pattern) -> ReteNode:
+        self._check_pattern(pattern)
         
         if pattern.model_class not in self.rete_root:
             self.rete_root[pattern.model_class] = TypeNode(pattern.model_class)
         current = self.rete_root[pattern.model_class]
         
-        for field_op, value in pattern.constraints.items():
-            if "__" in field_op: field, op = field_op.split("__")
-            else: field, op = field_op, "eq"
-            
-            found = None
-            for child in current.children:
-                if isinstance(child, AlphaNode) and \
-                   child.field == field and child.op == op and child.value == value:
-                    found = child
-                    break
+        # Variáveis repetidas no padrão viram nós "same" ao fim da cadeia
+        tests = pattern.parsed + tuple((field, "same", other) for field, other in pattern.same_fields)
+        for field, op, value in tests:
+            key = (field, op, value)
+            try:
+                found = current._alpha_index.get(key)
+            except TypeError:
+                # Valor não-hashable (ex: list): recai na busca linear
+                key = None
+                found = None
+                for child in current.children:
+                    if isinstance(child, AlphaNode) and \
+                       child.field == field and child.op == op and child.value == value:
+                        found = child
+                        break
             
             if found:
                 current = found
             else:
                 new_node = AlphaNode(field, op, value)
                 current.add_child(new_node)
+                if key is not None:
+                    current._alpha_index[key] = new_node
                 current = new_node
         return current
 
+    def _eq_signature(self, pattern: Pattern) -> Optional[Tuple[Tuple[str, ...], Tuple]]:
+        """
+        Retorna (campos, valores) se o padrão só tiver igualdades com valores
+        hashable, permitindo casá-lo com uma única busca em dicionário.
+        """
+        self._check_pattern(pattern)
+        fields, values = [], []
+        for field, op, value in sorted(pattern.parsed, key=lambda c: c[:2]):
+            if op != "eq" or isinstance(value, Match):
+                return None
+            try:
+                hash(value)
+            except TypeError:
+                return None
+            fields.append(field)
+            values.append(value)
+        return tuple(fields), tuple(values)
+
+    def _order_patterns(self, patterns: Tuple[Pattern, ...]) -> List[int]:
+        """
+        Escolhe a ordem dos joins: começa pelo padrão de menor escore
+        (cardinalidade estimada / restrições constantes) e segue pelos padrões
+        ligados por variáveis aos já escolhidos. Se a nova ordem gerar mais
+        produtos cartesianos que a ordem original, mantém a original.
+        """
+        def score(i: int) -> float:
+            pattern = patterns[i]
+            constants = sum(1 for v in pattern.constraints.values() if not isinstance(v, Match))
+            return self.cardinality_hint.get(pattern.model_class, 1) / (1 + constants)
+
+        def variables(i: int) -> Set[str]:
+            return {v.name for v in patterns[i].constraints.values() if isinstance(v, Match)}
+
+        def cartesians(order: List[int]) -> int:
+            known, count = variables(order[0]), 0
+            for i in order[1:]:
+                if not variables(i) & known:
+                    count += 1
+                known |= variables(i)
+            return count
+
+        source = list(range(len(patterns)))
+        remaining = sorted(source, key=score)
+        order = [remaining.pop(0)]
+        known = variables(order[0])
+        while remaining:
+            linked = [i for i in remaining if variables(i) & known]
+            nxt = linked[0] if linked else remaining[0]
+            remaining.remove(nxt)
+            order.append(nxt)
+            known |= variables(nxt)
+
+        if cartesians(order) > cartesians(source):
+            return source
+        return order
+
+    def _warn_orphan_vars(self, rule_name: str, patterns: List[Pattern], i: int):
+        """
+        Avisa quando um padrão vira produto cartesiano por usar variáveis que
+        não aparecem em nenhum outro padrão (geralmente erro de digitação).
+        """
+        names = {v.name for v in patterns[i].constraints.values() if isinstance(v, Match)}
+        # Variável repetida no próprio padrão restringe o padrão: não é órfã
+        repeated = {field for field, _ in patterns[i].same_fields}
+        names -= {v.name for field, _, v in patterns[i].parsed
+                  if field in repeated and isinstance(v, Match)}
+        others = {v.name for j, p in enumerate(patterns) if j != i
+                  for v in p.constraints.values() if isinstance(v, Match)}
+        orphans = sorted(names - others)
+        if orphans:
+            warnings.warn(
+                f"Regra {rule_name}: Pattern({patterns[i].model_class.__name__}, ...) usa "
+                f"{', '.join('MATCH.' + n for n in orphans)} sem ligação com outros padrões; "
+                f"o join será um produto cartesiano.",
+                stacklevel=5,
+            )
+
     def _compile_rule(self, method):
+        self._type_dispatch.clear()
         patterns = method._patterns
         terminal = RuleTerminalNode(method.__name__, method, method._salience)
 
+        for pattern in patterns:
+            self._check_pattern(pattern)
+            if _is_unsatisfiable(pattern):
+                # Nenhum fato pode casar: não gasta nós Alpha/Beta com a regra
+                warnings.warn(
+                    f"Regra {method.__name__}: restrições contraditórias em "
+                    f"Pattern({pattern.model_class.__name__}, ...); a regra nunca dispara e foi ignorada.",
+                    stacklevel=4,
+                )
+                return
+
         if len(patterns) == 1:
-            last_alpha = self._get_or_create_alpha_chain(patterns[0])
-            last_alpha.add_child(terminal)
+            eq_key = self._eq_signature(patterns[0])
+            if eq_key is not None:
+                fields, values = eq_key
+                by_fields = self._eq_shortcut.setdefault(patterns[0].model_class, {})
+                by_fields.setdefault(fields, {}).setdefault(values, []).append(terminal)
+            else:
+                # Fora da rede Alpha: um predicado gerado testa tudo de uma vez
+                terminal.fast_predicate = _compile_predicate(patterns[0])
+                self._fast_rules.setdefault(patterns[0].model_class, []).append(terminal)
         else:
+            # Junta primeiro os padrões mais seletivos
+            permutation = self._order_patterns(patterns)
+            if permutation != list(range(len(patterns))):
+                patterns = [patterns[i] for i in permutation]
+                terminal.order = [permutation.index(i) for i in range(len(patterns))]
+
             known_vars: Dict[str, Tuple[int, str]] = {}
             current_beta_input = self.dummy_beta
+            # Chave do prefixo de padrões já compilado; regras que começam com
+            # os mesmos padrões reaproveitam os mesmos nós Beta.
+            prefix_key: Optional[Tuple] = ()
+            var_slots: Dict[str, int] = {}
             
             # Popula variáveis do primeiro padrão
             first_pattern = patterns[0]
-            for k, v in first_pattern.constraints.items():
+            for field, _, v in first_pattern.parsed:
                 if isinstance(v, Match):
-                    field = k.split("__")[0]
-                    known_vars[v.name] = (0, field)
+                    known_vars.setdefault(v.name, (0, field))
 
             for i, pattern in enumerate(patterns):
-                alpha_tail = self._get_or_create_alpha_chain(pattern)
-                
-                if i == 0: continue
+                join_configs: List[Tuple[int, str, str]] = []
 
-                join_var = None
-                join_config = None
-
-                for k, v in pattern.constraints.items():
-                    if isinstance(v, Match):
-                        field_name = k.split("__")[0]
-                        if v.name in known_vars:
-                            left_idx, left_field = known_vars[v.name]
-                            join_config = (left_idx, left_field, field_name)
-                            join_var = v.name
-                            break 
-                        else:
+                # Percorre todas as variáveis do padrão: as já conhecidas viram
+                # chaves do join, e as novas ficam registradas para que padrões
+                # seguintes também possam fazer hash join com elas.
+                for field_name, _, v in pattern.parsed:
+                    if i > 0 and isinstance(v, Match):
+                        if v.name not in known_vars:
                             known_vars[v.name] = (i, field_name)
+                        elif known_vars[v.name][0] < i:
+                            left_idx, left_field = known_vars[v.name]
+                            join_configs.append((left_idx, left_field, field_name))
 
-                if join_config:
-                    join_node = HashJoinNode(*join_config)
+                if prefix_key is not None:
+                    try:
+                        prefix_key = (prefix_key, _canonical_pattern(pattern, var_slots), tuple(join_configs))
+                        cached = self._beta_prefix_cache.get(prefix_key)
+                    except TypeError:
+                        # Valor de restrição não-hashable: segue sem compartilhamento
+                        prefix_key = cached = None
+                    if cached is not None:
+                        current_beta_input = cached
+                        continue
+
+                if i == 0:
+                    # O primeiro padrão entra na rede Beta cruzando com o token raiz
+                    join_node = CartesianBetaNode()
+                elif len(join_configs) == 1:
+                    join_node = HashJoinNode(*join_configs[0])
+                elif join_configs:
+                    join_node = MultiKeyHashJoinNode(join_configs)
                 else:
                     join_node = CartesianBetaNode()
+                    self._warn_orphan_vars(method.__name__, patterns, i)
 
+                alpha_tail = self._get_or_create_alpha_chain(pattern)
                 current_beta_input.add_child(join_node)
                 alpha_tail.add_child(join_node)
+                if i == 0:
+                    join_node.left_activate(Token(None, None), self)
+                if prefix_key is not None:
+                    self._beta_prefix_cache[prefix_key] = join_node
                 current_beta_input = join_node
             
             current_beta_input.add_child(terminal)
-            self.dummy_beta.left_activate(self)
+
+    def _fire_eq_shortcuts(self, fact: Fact, by_fields: Dict[Tuple[str, ...], Dict[Tuple, List[RuleTerminalNode]]]):
+        for fields, by_values in by_fields.items():
+            values = tuple(getattr(fact, field, _MISSING) for field in fields)
+            try:
+                terminals = by_values.get(values)
+            except TypeError:
+                # Valor do fato não-hashable (ex: set) ainda pode ser igual a
+                # uma constante hashable (ex: frozenset): compara um a um
+                for constants, terminals in by_values.items():
+                    if constants == values:
+                        for terminal in terminals:
+                            terminal.activate_single(fact, self)
+                continue
+            if terminals:
+                for terminal in terminals:
+                    terminal.activate_single(fact, self)
+
+    def _dispatch_for(self, fact_type: type) -> _Dispatch:
+        """
+        Resolve uma vez por classe concreta tudo o que um fato dela visita,
+        incluindo regras escritas para superclasses (percorrendo a MRO).
+        """
+        dispatch = self._type_dispatch.get(fact_type)
+        if dispatch is None:
+            mro = fact_type.__mro__
+            type_nodes = tuple(self.rete_root[t] for t in mro if t in self.rete_root)
+            dispatch = (
+                tuple(self._eq_shortcut[t] for t in mro if t in self._eq_shortcut),
+                # Lista plana: declare só desempacota tuplas, sem ler atributos do terminal
+                tuple((terminal.fast_predicate, terminal.activate_single)
+                      for t in mro for terminal in self._fast_rules.get(t, ())),
+                type_nodes,
+                tuple(tn.walk or partial(_walk_alpha, tn) for tn in type_nodes),
+            )
+            self._type_dispatch[fact_type] = dispatch
+        return dispatch
 
     def declare(self, fact: Fact):
+        if self._deferred is not None:
+            self._deferred.append(fact)
+            return
         fact_type = type(fact)
-        if fact_type in self.rete_root:
-            self.rete_root[fact_type].activate(fact, self)
+        dispatch = self._type_dispatch.get(fact_type) or self._dispatch_for(fact_type)
+        eq_shortcuts, fast_rules, _, walks = dispatch
+        # Ordem na agenda entre ativações de mesma saliência (documentada no
+        # README): atalhos de igualdade, regras rápidas, depois a rede Rete
+        for by_fields in eq_shortcuts:
+            self._fire_eq_shortcuts(fact, by_fields)
+        for predicate, activate in fast_rules:
+            if predicate(fact):
+                activate(fact, self)
+        # A MRO já garantiu o isinstance: entra direto abaixo do TypeNode
+        for walk in walks:
+            walk(fact, self)
+
+    def compile(self):
+        """
+        Opcional: congela a rede atual, desenrolando a sub-rede Alpha de cada
+        tipo numa única função gerada (ver _compile_alpha_walk) que declare()
+        passa a usar. Vale a pena para muitas regras e muitos fatos; reset()
+        recompila automaticamente.
+        """
+        for type_node in self.rete_root.values():
+            type_node.walk = _compile_alpha_walk(type_node)
+        self._compiled = True
+        self._type_dispatch.clear()
+        return self
+
+    @contextmanager
+    def bulk(self):
+        """
+        Carga inicial em lote: dentro do bloco as ativações só são acumuladas
+        e a agenda é ordenada uma única vez na saída.
+
+            with engine.bulk():
+                for fato in fatos:
+                    engine.declare(fato)
+        """
+        self.agenda.begin_bulk()
+        try:
+            yield self
+        finally:
+            self.agenda.end_bulk()
+
+    def declare_many(self, facts: Iterable[Fact]):
+        """
+        Declara vários fatos de uma vez. Os fatos são agrupados por tipo e cada
+        AlphaNode filtra o lote inteiro numa só passada, em vez de percorrer a
+        rede fato a fato. As mesmas ativações de declare() são geradas, mas a
+        ordem entre ativações de mesma saliência pode diferir.
+        """
+        if self._deferred is not None:
+            self._deferred.extend(facts)
+            return
+        batches: Dict[Type[Fact], List[Fact]] = defaultdict(list)
+        for fact in facts:
+            batches[type(fact)].append(fact)
+        with self.bulk():
+            for fact_type, batch in batches.items():
+                eq_shortcuts, fast_rules, type_nodes, _ = self._dispatch_for(fact_type)
+                for by_fields in eq_shortcuts:
+                    for fact in batch:
+                        self._fire_eq_shortcuts(fact, by_fields)
+                for predicate, activate in fast_rules:
+                    for fact in batch:
+                        if predicate(fact):
+                            activate(fact, self)
+                for type_node in type_nodes:
+                    type_node._fan_out_many(batch, self)
+
+    def _fire(self, activation: Activation):
+        try:
+            # Injeta os fatos correspondentes na função da regra
+            # (Versão Simplificada: passa os objetos Fact na ordem)
+            params = activation.node.arity
+            if params == 0: 
+                activation.node.action()
+            else: 
+                # Garante que não passamos mais argumentos do que a função pede
+                activation.node.action(*activation.facts[:params])
+        except Exception as e:
+            print(f" [ERROR] Rule {activation.node.rule_name}: {e}")
+            # Opcional: raise e para ver o stack trace completo
 
     def run(self):
         steps = 0
         while steps < 1000:
             activation = self.agenda.pop()
             if not activation: break
-            try:
-                # Injeta os fatos correspondentes na função da regra
-                # (Versão Simplificada: passa os objetos Fact na ordem)
-                sig = inspect.signature(activation.node.action)
-                params = len(sig.parameters)
-                if params == 0: 
-                    activation.node.action()
-                else: 
-                    # Garante que não passamos mais argumentos do que a função pede
-                    activation.node.action(*activation.facts[:params])
-            except Exception as e:
-                print(f" [ERROR] Rule {activation.node.rule_name}: {e}")
-                # Opcional: raise e para ver o stack trace completo
-            steps += 1
\ No newline at end of file
+            self._fire(activation)
+            steps += 1
+
+    def run_parallel(self, n_workers: Optional[int] = None):
+        """
+        Como run(), mas quando o topo da agenda é uma regra parallel_safe as
+        ativações parallel_safe seguidas saem juntas e disparam num
+        ThreadPoolExecutor. Fatos declarados por elas só entram na rede quando
+        o lote termina. As demais regras disparam uma a uma, exatamente como
+        em run().
+        """
+        steps = 0
+        with ThreadPoolExecutor(max_workers=n_workers) as pool:
+            while steps < 1000:
+                activation = self.agenda.pop()
+                if not activation: break
+                if not activation.node.parallel_safe:
+                    self._fire(activation)
+                    steps += 1
+                    continue
+                batch = [activation]
+                while len(batch) < 1000 - steps:
+                    top = self.agenda.peek()
+                    if top is None or not top.node.parallel_safe: break
+                    batch.append(self.agenda.pop())
+                self._fire_parallel(pool, batch)
+                steps += len(batch)
+
+    def _fire_parallel(self, pool: ThreadPoolExecutor, activations: List[Activation]):
+        deferred = self._deferred = []
+        try:
+            # list() espera o lote inteiro; _fire já trata erros de cada regra
+            list(pool.map(self._fire, activations))
+        finally:
+            self._deferred = None
+        for fact in deferred:
+            self.declare(fact)
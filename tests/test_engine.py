@@ -0,0 +1,470 @@
+"""
+Testes da engine: joins, compartilhamento de nós, reordenação de padrões,
+herança de fatos e os modos de carga/execução (declare_many, bulk, compile,
+run_parallel) comparados com declare()/run() e com um oráculo de força bruta.
+
+Rodar com: python -m unittest discover -s tests
+"""
+import itertools
+import random
+import unittest
+import warnings
+from collections import Counter
+
+from ikin_expert import KnowledgeEngine, Rule, Fact, Pattern, MATCH
+from ikin_expert.engine import HashJoinNode, MultiKeyHashJoinNode
+
+
+# =============================================================================
+# FATOS E ENGINES DE APOIO
+# =============================================================================
+
+class Cliente(Fact):
+    id: int
+    nome: str
+    status: str
+
+class ClientePJ(Cliente):
+    cnpj: str
+
+class Transacao(Fact):
+    cliente_id: int
+    valor: float
+
+class Loja(Fact):
+    cliente_id: int
+    nome: str
+
+class Exame(Fact):
+    paciente: int
+    data: int
+    tipo: str
+
+class Consulta(Fact):
+    paciente: int
+    data: int
+
+
+class Fraude(KnowledgeEngine):
+    def __init__(self):
+        self.disparos = []
+        super().__init__()
+
+    @Rule(Pattern(Cliente, id=MATCH.cid, status="VIP"),
+          Pattern(Transacao, cliente_id=MATCH.cid, valor__gt=5000.0), salience=100)
+    def alerta_vip(self, c, t):
+        self.disparos.append(("vip", c.nome, t.valor))
+
+    @Rule(Pattern(Transacao, valor__gt=10000.0), salience=50)
+    def alerta_geral(self, t):
+        self.disparos.append(("geral", t.valor))
+
+    @Rule(Pattern(Cliente, status="VIP"), salience=10)
+    def eh_vip(self, c):
+        self.disparos.append(("eh_vip", c.nome))
+
+    @Rule(Pattern(Cliente, id=MATCH.cid), Pattern(Transacao, cliente_id=MATCH.cid),
+          Pattern(Loja, cliente_id=MATCH.cid), salience=1)
+    def compra_em_loja(self, c, t, l):
+        self.disparos.append(("loja", c.nome, t.valor, l.nome))
+
+
+FATOS_FRAUDE = [
+    Transacao(cliente_id=1, valor=6000.0),
+    Cliente(id=1, nome="K", status="VIP"),
+    Cliente(id=2, nome="V", status="Comum"),
+    Transacao(cliente_id=2, valor=20000.0),
+    Loja(cliente_id=1, nome="L1"),
+    Loja(cliente_id=3, nome="L3"),
+]
+
+ESPERADO_FRAUDE = [
+    ("vip", "K", 6000.0),
+    ("geral", 20000.0),
+    ("eh_vip", "K"),
+    ("loja", "K", 6000.0, "L1"),
+]
+
+
+def _rodar(engine_cls, fatos, modo="declare"):
+    engine = engine_cls()
+    if modo == "compile":
+        engine.compile()
+    if modo == "declare_many":
+        engine.declare_many(fatos)
+    elif modo == "bulk":
+        with engine.bulk():
+            for fato in fatos:
+                engine.declare(fato)
+    else:
+        for fato in fatos:
+            engine.declare(fato)
+    if modo == "run_parallel":
+        engine.run_parallel(n_workers=4)
+    else:
+        engine.run()
+    return engine.disparos
+
+
+# =============================================================================
+# JOINS
+# =============================================================================
+
+class TestJoins(unittest.TestCase):
+    def test_hash_join_dispara(self):
+        self.assertEqual(_rodar(Fraude, FATOS_FRAUDE), ESPERADO_FRAUDE)
+
+    def test_join_independe_da_ordem_dos_fatos(self):
+        self.assertEqual(sorted(_rodar(Fraude, FATOS_FRAUDE[::-1]), key=str),
+                         sorted(ESPERADO_FRAUDE, key=str))
+
+    def test_multi_key_join(self):
+        class Clinica(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(Consulta, paciente=MATCH.p, data=MATCH.d),
+                  Pattern(Exame, paciente=MATCH.p, data=MATCH.d))
+            def exame_do_dia(self, c, e):
+                self.disparos.append((c.paciente, c.data, e.tipo))
+
+        engine = Clinica()
+        joins = [n for n in engine._beta_prefix_cache.values() if isinstance(n, HashJoinNode)]
+        self.assertEqual(len(joins), 1)
+        self.assertIsInstance(joins[0], MultiKeyHashJoinNode)
+        self.assertEqual(len(joins[0].join_configs), 2)
+
+        engine.declare(Consulta(paciente=1, data=10))
+        engine.declare(Exame(paciente=1, data=10, tipo="sangue"))
+        engine.declare(Exame(paciente=1, data=11, tipo="urina"))
+        engine.declare(Exame(paciente=2, data=10, tipo="raio-x"))
+        engine.run()
+        self.assertEqual(engine.disparos, [(1, 10, "sangue")])
+
+    def test_variavel_repetida_no_mesmo_padrao(self):
+        class Q(Fact):
+            x: int
+            y: int
+
+        class E(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(Q, x=MATCH.v, y=MATCH.v))
+            def iguais(self, q):
+                self.disparos.append(("iguais", q.x, q.y))
+
+            @Rule(Pattern(Q, x=MATCH.v, y=MATCH.v), Pattern(Loja, cliente_id=MATCH.v))
+            def iguais_com_loja(self, q, l):
+                self.disparos.append(("loja", q.x, l.nome))
+
+        fatos = [Q(x=1, y=2), Q(x=3, y=3), Loja(cliente_id=1, nome="A"), Loja(cliente_id=3, nome="B")]
+        for modo in ("declare", "declare_many", "compile"):
+            with self.subTest(modo=modo):
+                self.assertEqual(sorted(_rodar(E, fatos, modo)),
+                                 [("iguais", 3, 3), ("loja", 3, "B")])
+
+    def test_igualdade_com_valor_nao_hashable(self):
+        class S(Fact):
+            tags: set
+            n: int = 0
+
+        class E(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            # Só igualdades: atalho por dicionário
+            @Rule(Pattern(S, tags=frozenset({1})))
+            def atalho(self, s):
+                self.disparos.append("atalho")
+
+            # Com outra restrição: predicado gerado
+            @Rule(Pattern(S, tags=frozenset({1}), n__gte=0))
+            def predicado(self, s):
+                self.disparos.append("predicado")
+
+        for modo in ("declare", "declare_many"):
+            with self.subTest(modo=modo):
+                self.assertEqual(sorted(_rodar(E, [S(tags={1}), S(tags={2})], modo)),
+                                 ["atalho", "predicado"])
+
+    def test_operador_invalido(self):
+        with self.assertRaises(ValueError) as ctx:
+            Pattern(Cliente, id__foo__gt=1)
+        self.assertIn("id__foo__gt", str(ctx.exception))
+
+
+# =============================================================================
+# COMPILAÇÃO DA REDE
+# =============================================================================
+
+class TestCompilacao(unittest.TestCase):
+    def test_prefixo_beta_compartilhado(self):
+        class E(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(Cliente, id=MATCH.c), Pattern(Transacao, cliente_id=MATCH.c))
+            def r1(self, c, t):
+                self.disparos.append("r1")
+
+            @Rule(Pattern(Cliente, id=MATCH.x), Pattern(Transacao, cliente_id=MATCH.x),
+                  Pattern(Loja, cliente_id=MATCH.x))
+            def r2(self, c, t, l):
+                self.disparos.append("r2")
+
+        engine = E()
+        # Um único nó de entrada e um único join Cliente x Transacao
+        self.assertEqual(len(engine.dummy_beta.children), 1)
+        join = engine.dummy_beta.children[0].children[0]
+        self.assertIsInstance(join, HashJoinNode)
+        self.assertEqual(len(join.children), 2)
+
+        for fato in FATOS_FRAUDE:
+            engine.declare(fato)
+        engine.run()
+        self.assertEqual(sorted(engine.disparos), ["r1", "r1", "r2"])
+
+    def test_reordenacao_preserva_ordem_dos_fatos_na_acao(self):
+        class E(KnowledgeEngine):
+            cardinality_hint = {Transacao: 10_000, Cliente: 10}
+
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(Transacao, cliente_id=MATCH.c), Pattern(Cliente, id=MATCH.c, status="VIP"))
+            def r(self, t, c):
+                self.disparos.append((type(t).__name__, type(c).__name__, c.nome))
+
+        engine = E()
+        terminal = engine.dummy_beta.children[0].children[0].children[0]
+        self.assertEqual(terminal.order, [1, 0])  # Cliente foi para o início
+
+        for fato in FATOS_FRAUDE:
+            engine.declare(fato)
+        engine.run()
+        self.assertEqual(engine.disparos, [("Transacao", "Cliente", "K")])
+
+    def test_regra_contraditoria_e_ignorada(self):
+        with warnings.catch_warnings(record=True) as avisos:
+            warnings.simplefilter("always")
+
+            class E(KnowledgeEngine):
+                @Rule(Pattern(Transacao, valor=1.0, valor__gt=5.0))
+                def nunca(self, t):
+                    raise AssertionError("não deveria disparar")
+
+            engine = E()
+        self.assertTrue(any("contraditórias" in str(a.message) for a in avisos))
+        engine.declare(Transacao(cliente_id=1, valor=1.0))
+        self.assertIsNone(engine.agenda.pop())
+
+
+# =============================================================================
+# HERANÇA DE FATOS
+# =============================================================================
+
+class TestHeranca(unittest.TestCase):
+    def test_subclasse_casa_regras_da_base(self):
+        pj = ClientePJ(id=1, nome="ACME", status="VIP", cnpj="0001")
+        fatos = [pj, Transacao(cliente_id=1, valor=6000.0)]
+        for modo in ("declare", "declare_many", "compile"):
+            with self.subTest(modo=modo):
+                self.assertEqual(sorted(_rodar(Fraude, fatos, modo), key=str),
+                                 sorted([("vip", "ACME", 6000.0), ("eh_vip", "ACME")], key=str))
+
+    def test_regra_da_subclasse_nao_casa_base(self):
+        class E(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(ClientePJ, status="VIP"))
+            def pj(self, c):
+                self.disparos.append(c.nome)
+
+        fatos = [Cliente(id=1, nome="PF", status="VIP"),
+                 ClientePJ(id=2, nome="PJ", status="VIP", cnpj="1")]
+        self.assertEqual(_rodar(E, fatos), ["PJ"])
+
+
+# =============================================================================
+# MODOS DE CARGA E EXECUÇÃO
+# =============================================================================
+
+class TestModos(unittest.TestCase):
+    def test_mesma_ordem_que_declare_run(self):
+        # bulk, compile e run_parallel (sem regras paralelas) mantêm a ordem
+        for modo in ("bulk", "compile", "run_parallel"):
+            with self.subTest(modo=modo):
+                self.assertEqual(_rodar(Fraude, FATOS_FRAUDE, modo), ESPERADO_FRAUDE)
+
+    def test_run_dentro_de_bulk(self):
+        # A agenda volta a ser heap a cada nova ativação anexada no bloco
+        engine = Fraude()
+        with engine.bulk():
+            for fato in FATOS_FRAUDE[:3]:
+                engine.declare(fato)
+            engine.run()
+            for fato in FATOS_FRAUDE[3:]:
+                engine.declare(fato)
+            engine.run()
+        self.assertEqual(engine.disparos, [("vip", "K", 6000.0), ("eh_vip", "K"),
+                                           ("geral", 20000.0), ("loja", "K", 6000.0, "L1")])
+
+    def test_declare_many_mesmas_ativacoes(self):
+        self.assertEqual(sorted(_rodar(Fraude, FATOS_FRAUDE, "declare_many"), key=str),
+                         sorted(ESPERADO_FRAUDE, key=str))
+
+    def test_run_parallel_respeita_saliencia_de_regras_sequenciais(self):
+        class A(Fact):
+            v: int
+
+        class U(Fact):
+            v: int
+
+        for paralela in (False, True):
+            class E(KnowledgeEngine):
+                def __init__(self):
+                    self.disparos = []
+                    super().__init__()
+
+                @Rule(Pattern(A, v=1), salience=10, parallel_safe=paralela)
+                def a(self, x):
+                    self.disparos.append("a")
+                    self.declare(U(v=1))
+
+                @Rule(Pattern(U, v=1), salience=100)
+                def urgente(self, u):
+                    self.disparos.append("urgente")
+
+                @Rule(Pattern(A, v=1), salience=0)
+                def b(self, x):
+                    self.disparos.append("b")
+
+            with self.subTest(paralela=paralela):
+                self.assertEqual(_rodar(E, [A(v=1)]), ["a", "urgente", "b"])
+                self.assertEqual(_rodar(E, [A(v=1)], "run_parallel"), ["a", "urgente", "b"])
+
+    def test_run_parallel_adia_declaracoes_das_regras_paralelas(self):
+        class N(Fact):
+            v: int
+
+        class Dobro(Fact):
+            v: int
+
+        class E(KnowledgeEngine):
+            def __init__(self):
+                self.disparos = []
+                super().__init__()
+
+            @Rule(Pattern(N, v=MATCH.v), parallel_safe=True, salience=10)
+            def dobra(self, n):
+                self.declare(Dobro(v=n.v * 2))
+
+            @Rule(Pattern(Dobro, v__gt=2))
+            def grande(self, d):
+                self.disparos.append(d.v)
+
+        fatos = [N(v=v) for v in range(1, 6)]
+        self.assertEqual(sorted(_rodar(E, fatos, "run_parallel")), [4, 6, 8, 10])
+        self.assertEqual(sorted(_rodar(E, fatos)), [4, 6, 8, 10])
+
+
+# =============================================================================
+# ORÁCULO DE FORÇA BRUTA
+# =============================================================================
+
+class P(Fact):
+    id: int
+    x: int
+    y: int
+
+class R(Fact):
+    id: int
+    x: int
+    y: int
+
+_OPERADORES = {
+    "eq": lambda a, b: a == b,
+    "neq": lambda a, b: a != b,
+    "gt": lambda a, b: a > b,
+    "gte": lambda a, b: a >= b,
+    "lt": lambda a, b: a < b,
+    "lte": lambda a, b: a <= b,
+}
+
+def _padrao_aleatorio(rng):
+    restricoes = {}
+    for _ in range(rng.randint(0, 3)):
+        campo = rng.choice(("x", "y"))
+        if rng.random() < 0.4:
+            restricoes.setdefault(campo, getattr(MATCH, rng.choice(("p", "q"))))
+        else:
+            op = rng.choice(tuple(_OPERADORES))
+            restricoes.setdefault(campo if op == "eq" else f"{campo}__{op}", rng.randint(0, 3))
+    return Pattern(rng.choice((P, R)), **restricoes)
+
+def _casa(padroes, fatos) -> bool:
+    ligacoes = {}
+    for padrao, fato in zip(padroes, fatos):
+        if not isinstance(fato, padrao.model_class):
+            return False
+        for campo, op, valor in padrao.parsed:
+            atual = getattr(fato, campo)
+            if isinstance(valor, type(MATCH)):
+                if ligacoes.setdefault(valor.name, atual) != atual:
+                    return False
+            elif not _OPERADORES[op](atual, valor):
+                return False
+    return True
+
+def _acao(nome, aridade):
+    # A engine usa a aridade da ação: gera uma função com parâmetros explícitos
+    params = ", ".join(f"f{i}" for i in range(aridade))
+    namespace = {}
+    exec(f"def acao(self, {params}):\n"
+         f"    self.disparos.append(({nome!r}, tuple(f.id for f in ({params},))))\n", namespace)
+    acao = namespace["acao"]
+    acao.__name__ = nome
+    return acao
+
+def _engine_aleatoria(rng):
+    regras = {}
+    atributos = {"__init__": lambda self: (setattr(self, "disparos", []), KnowledgeEngine.__init__(self))[1]}
+    for i in range(rng.randint(1, 3)):
+        padroes = tuple(_padrao_aleatorio(rng) for _ in range(rng.randint(1, 3)))
+        nome = f"regra{i}"
+        regras[nome] = padroes
+        atributos[nome] = Rule(*padroes, salience=rng.randint(0, 2),
+                               parallel_safe=rng.random() < 0.5)(_acao(nome, len(padroes)))
+    return type("Aleatoria", (KnowledgeEngine,), atributos), regras
+
+
+class TestOraculo(unittest.TestCase):
+    def test_rulebases_aleatorias(self):
+        rng = random.Random(2026)
+        for caso in range(150):
+            engine_cls, regras = _engine_aleatoria(rng)
+            fatos = [rng.choice((P, R))(id=i, x=rng.randint(0, 3), y=rng.randint(0, 3))
+                     for i in range(rng.randint(1, 5))]
+            esperado = Counter(
+                (nome, tuple(f.id for f in combinacao))
+                for nome, padroes in regras.items()
+                for combinacao in itertools.product(fatos, repeat=len(padroes))
+                if _casa(padroes, combinacao)
+            )
+            for modo in ("declare", "declare_many", "bulk", "compile", "run_parallel"):
+                with self.subTest(caso=caso, modo=modo), warnings.catch_warnings():
+                    # Regras aleatórias geram avisos de join cartesiano/contradição
+                    warnings.simplefilter("ignore")
+                    self.assertEqual(Counter(_rodar(engine_cls, fatos, modo)), esperado)
+
+
+if __name__ == "__main__":
+    unittest.main()